@@ -1,16 +1,26 @@
 """Connect to the Konfuzio Server to receive or send data."""
 
+import functools
 import json
 import logging
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
 from json import JSONDecodeError
 from operator import itemgetter
 from typing import List, Union
+from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
 
 import requests
 from requests import HTTPError
 from requests.adapters import HTTPAdapter
 from urllib3 import Retry
+from urllib3.fields import RequestField
+from urllib3.filepost import choose_boundary
+
+try:
+    import orjson as _json  # parses the raw bytes of a response without decoding them to str first
+except ImportError:
+    import json as _json
 
 from konfuzio_sdk import KONFUZIO_HOST, KONFUZIO_TOKEN
 from konfuzio_sdk.urls import (
@@ -35,6 +45,41 @@ from konfuzio_sdk.utils import is_file
 
 logger = logging.getLogger(__name__)
 
+# keep enough connections alive so concurrent calls sharing one session do not discard warm TLS connections
+_POOL_SIZE = 32
+# number of requests sent at the same time when loading independent resources, e.g. pages of a paginated list
+_MAX_CONCURRENT_REQUESTS = 8
+
+# URLs only depend on their arguments, so build each URL once and reuse it in loops over Documents and Annotations
+get_project_url = functools.lru_cache(maxsize=4096)(get_project_url)
+get_document_api_details_url = functools.lru_cache(maxsize=4096)(get_document_api_details_url)
+get_document_ocr_file_url = functools.lru_cache(maxsize=4096)(get_document_ocr_file_url)
+get_document_original_file_url = functools.lru_cache(maxsize=4096)(get_document_original_file_url)
+get_document_annotations_url = functools.lru_cache(maxsize=4096)(get_document_annotations_url)
+get_annotation_url = functools.lru_cache(maxsize=4096)(get_annotation_url)
+get_document_url = functools.lru_cache(maxsize=4096)(get_document_url)
+get_document_segmentation_details_url = functools.lru_cache(maxsize=4096)(get_document_segmentation_details_url)
+get_page_image_url = functools.lru_cache(maxsize=4096)(get_page_image_url)
+
+
+# requests raises its own JSONDecodeError since version 2.27, before it raised the one of the json module
+_RequestsJSONDecodeError = getattr(requests.exceptions, 'JSONDecodeError', JSONDecodeError)
+
+
+def _loads(response) -> Union[dict, list]:
+    """
+    Parse the JSON of a response from its raw bytes.
+
+    Errors are raised like by Response.json(), so callers can keep catching the exceptions of requests.
+
+    :param response: Response of the Konfuzio Server
+    :return: Parsed JSON.
+    """
+    try:
+        return _json.loads(response.content)
+    except JSONDecodeError as e:
+        raise _RequestsJSONDecodeError(e.msg, e.doc, e.pos)
+
 
 def _get_auth_token(username, password, host=KONFUZIO_HOST) -> str:
     """
@@ -45,14 +90,15 @@ def _get_auth_token(username, password, host=KONFUZIO_HOST) -> str:
     url = get_auth_token_url(host)
     user_credentials = {"username": username, "password": password}
     r = requests.post(url, json=user_credentials)
-    if r.status_code == 200:
-        token = r.json()['token']
-    elif r.status_code in [403, 400]:
+    status_code = r.status_code
+    if status_code == 200:
+        token = _loads(r)['token']
+    elif status_code in [403, 400]:
         raise PermissionError(
             "[ERROR] Your credentials are not correct! Please run init again and provide the correct credentials."
         )
     else:
-        raise ConnectionError(f'HTTP Status {r.status_code}: {r.text}')
+        raise ConnectionError(f'HTTP Status {status_code}: {r.text}')
     return token
 
 
@@ -92,10 +138,10 @@ class TimeoutHTTPAdapter(HTTPAdapter):
 
     timeout = None  # see https://stackoverflow.com/a/29649638
 
-    def __init__(self, timeout, *args, **kwargs):
+    def __init__(self, timeout, *args, pool_connections=_POOL_SIZE, pool_maxsize=_POOL_SIZE, **kwargs):
         """Force to init with timout policy."""
         self.timeout = timeout
-        super().__init__(*args, **kwargs)
+        super().__init__(*args, pool_connections=pool_connections, pool_maxsize=pool_maxsize, **kwargs)
 
     def send(self, request, *args, **kwargs):
         """Use timeout policy if not otherwise declared."""
@@ -121,37 +167,114 @@ class TimeoutHTTPAdapter(HTTPAdapter):
         return response
 
 
+class PostRetry(Retry):
+    """Retry POST requests only on gateway errors which show that the Host did not process them.
+
+    Documentation
+    =============
+        * `Urllib3 <https://urllib3.readthedocs.io/en/latest/reference/urllib3.util.html#urllib3.util.Retry>`_
+    """
+
+    # a 504 can be returned after the Host processed the request, so it is not retried
+    POST_STATUS_FORCELIST = frozenset([502, 503])
+    # once used up, the last response is returned, so the caller can handle its status code
+    POST_TOTAL = 2
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        """Retry POST requests on gateway errors up to POST_TOTAL times, all other methods by the retry strategy."""
+        if method.upper() == 'POST':
+            return status_code in self.POST_STATUS_FORCELIST and len(self.history) < self.POST_TOTAL
+        return super().is_retry(method, status_code, has_retry_after=has_retry_after)
+
+
+# Retry strategies never change, urllib3 creates a new Retry for every retry, so all sessions can share them
+_RETRY_STRATEGY = Retry(
+    total=5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    backoff_factor=2,
+    # allowed_methods=["HEAD", "GET", "PUT", "DELETE", "OPTIONS", "TRACE"],  # POST excluded
+)
+_POST_RETRY_STRATEGY = PostRetry(
+    total=5, status_forcelist=[429, 500, 502, 503, 504], backoff_factor=2, respect_retry_after_header=True
+)
+
+
+class _KonfuzioSession(requests.Session):
+    """Session which can use an adapter for one URL only, other than mount, which matches all URLs with this prefix."""
+
+    __attrs__ = requests.Session.__attrs__ + ['exact_adapters']
+
+    def __init__(self):
+        """Start without adapters for exact URLs."""
+        super().__init__()
+        self.exact_adapters = {}
+
+    def mount_exact(self, url: str, adapter):
+        """Use the adapter for requests to this URL, but not to the URLs below it."""
+        self.exact_adapters[url] = adapter
+
+    def get_adapter(self, url):
+        """Return the adapter mounted for exactly this URL, otherwise the adapter mounted for its prefix."""
+        adapter = self.exact_adapters.get(url)
+        if adapter is None:
+            adapter = super().get_adapter(url)
+        return adapter
+
+
 def _konfuzio_session(token: str = KONFUZIO_TOKEN):
     """
     Create a session incl. Token to the KONFUZIO_HOST.
 
     :return: Request session.
     """
-    retry_strategy = Retry(
-        total=5,
-        status_forcelist=[429, 500, 502, 503, 504],
-        backoff_factor=2,
-        # allowed_methods=["HEAD", "GET", "PUT", "DELETE", "OPTIONS", "TRACE"],  # POST excluded
-    )
-    session = requests.Session()
-    session.mount('https://', adapter=TimeoutHTTPAdapter(max_retries=retry_strategy, timeout=120))
+    session = _KonfuzioSession()
+    adapter = TimeoutHTTPAdapter(max_retries=_RETRY_STRATEGY, timeout=120)
+    # share one pool of persistent connections, also for hosts which are not served via TLS, e.g. on-premises
+    session.mount('https://', adapter=adapter)
+    session.mount('http://', adapter=adapter)
+    # creating a Project or Label can be repeated safely if a gateway did not pass the request to the Host, other
+    # POST requests, e.g. to create Annotations below the URL of a Project, are never retried
+    post_retry_adapter = TimeoutHTTPAdapter(max_retries=_POST_RETRY_STRATEGY, timeout=120)
+    session.mount_exact(get_projects_list_url(), adapter=post_retry_adapter)
+    session.mount_exact(get_labels_url(), adapter=post_retry_adapter)
     session.headers.update({'Authorization': f'Token {token}'})
     return session
 
 
-def get_project_list(session=_konfuzio_session()):
+@functools.lru_cache(maxsize=1)
+def _get_default_session():
+    """
+    Create the session used by all API functions which are called without a session, once per process.
+
+    :return: Request session.
+    """
+    return _konfuzio_session()
+
+
+@functools.lru_cache(maxsize=1)
+def _get_default_executor() -> ThreadPoolExecutor:
+    """
+    Create the thread pool used to parse responses in the background, once per process.
+
+    :return: Thread pool executor.
+    """
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix='konfuzio_sdk')
+
+
+def get_project_list(session=None):
     """
     Get the list of all Projects for the user.
 
     :param session: Konfuzio session with Retry and Timeout policy
     :return: Response object
     """
+    session = session or _get_default_session()
     url = get_projects_list_url()
     r = session.get(url=url)
-    return r.json()
+    return _loads(r)
 
 
-def get_project_details(project_id: int, session=_konfuzio_session()) -> dict:
+def get_project_details(project_id: int, session=None) -> dict:
     """
     Get Label Sets available in Project.
 
@@ -159,13 +282,14 @@ def get_project_details(project_id: int, session=_konfuzio_session()) -> dict:
     :param session: Konfuzio session with Retry and Timeout policy
     :return: Sorted Label Sets.
     """
+    session = session or _get_default_session()
     url = get_project_url(project_id=project_id)
     r = session.get(url=url)
     r.raise_for_status()
-    return r.json()
+    return _loads(r)
 
 
-def create_new_project(project_name, session=_konfuzio_session()):
+def create_new_project(project_name, session=None):
     """
     Create a new Project for the user.
 
@@ -173,22 +297,24 @@ def create_new_project(project_name, session=_konfuzio_session()):
     :param session: Konfuzio session with Retry and Timeout policy
     :return: Response object
     """
+    session = session or _get_default_session()
     url = get_projects_list_url()
     new_project_data = {"name": project_name}
     r = session.post(url=url, json=new_project_data)
+    status_code = r.status_code
 
-    if r.status_code == 201:
-        project_id = r.json()["id"]
+    if status_code == 201:
+        project_id = _loads(r)["id"]
         print(f"Project {project_name} (ID {project_id}) was created successfully!")
         return project_id
     else:
         raise PermissionError(
-            f'HTTP Status {r.status_code}: The project {project_name} was not created, please check'
+            f'HTTP Status {status_code}: The project {project_name} was not created, please check'
             f' your permissions. Error {r.json()}'
         )
 
 
-def get_document_details(document_id: int, project_id: int, session=_konfuzio_session(), extra_fields: str = ''):
+def get_document_details(document_id: int, project_id: int, session=None, extra_fields: str = ''):
     """
     Use the text-extraction server to retrieve the data from a document.
 
@@ -198,12 +324,55 @@ def get_document_details(document_id: int, project_id: int, session=_konfuzio_se
     :param extra_fields: Retrieve bounding boxes and HOCR from document, too. Can be "bbox,hocr", it's a hotfix
     :return: Data of the document.
     """
+    session = session or _get_default_session()
     url = get_document_api_details_url(document_id=document_id, project_id=project_id, extra_fields=extra_fields)
     r = session.get(url)
-    return r.json()
+    return _loads(r)
 
 
-def get_page_image(page_id: int, session=_konfuzio_session(), thumbnail: bool = False):
+def submit_document_details(document_id: int, project_id: int, session=None, extra_fields: str = '') -> Future:
+    """
+    Use the text-extraction server to retrieve the data from a document and parse it in the background.
+
+    The response is received by the calling thread, so the next document can be requested while the data of the
+    previous document is parsed.
+
+    :param document_id: ID of the document
+    :param project_id: ID of the Project
+    :param session: Konfuzio session with Retry and Timeout policy
+    :param extra_fields: Retrieve bounding boxes and HOCR from document, too. Can be "bbox,hocr", it's a hotfix
+    :return: Future of the data of the document.
+    """
+    session = session or _get_default_session()
+    url = get_document_api_details_url(document_id=document_id, project_id=project_id, extra_fields=extra_fields)
+    r = session.get(url)
+    return _get_default_executor().submit(_loads, r)
+
+
+def get_many_document_details(
+    document_ids: List[int],
+    project_id: int,
+    session=None,
+    extra_fields: str = '',
+    concurrency: int = _MAX_CONCURRENT_REQUESTS,
+) -> List[dict]:
+    """
+    Use the text-extraction server to retrieve the data of many documents at the same time.
+
+    :param document_ids: IDs of the documents
+    :param project_id: ID of the Project
+    :param session: Konfuzio session with Retry and Timeout policy
+    :param extra_fields: Retrieve bounding boxes and HOCR from document, too. Can be "bbox,hocr", it's a hotfix
+    :param concurrency: Maximum number of documents requested at the same time
+    :return: Data of the documents in the order of their IDs.
+    """
+    session = session or _get_default_session()
+    load = functools.partial(get_document_details, project_id=project_id, session=session, extra_fields=extra_fields)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(load, document_ids))
+
+
+def get_page_image(page_id: int, session=None, thumbnail: bool = False):
     """
     Load image of a Page as Bytes.
 
@@ -212,6 +381,7 @@ def get_page_image(page_id: int, session=_konfuzio_session(), thumbnail: bool =
     :param session: Konfuzio session with Retry and Timeout policy
     :return: Bytes of the Image.
     """
+    session = session or _get_default_session()
     if thumbnail:
         raise NotImplementedError
     else:
@@ -226,20 +396,109 @@ def get_page_image(page_id: int, session=_konfuzio_session(), thumbnail: bool =
     return r.content
 
 
-# def post_document_bulk_annotation(document_id: int, project_id: int, annotation_list, session=_konfuzio_session()):
-#     """
-#     Add a list of Annotations to an existing document.
-#
-#     :param document_id: ID of the file
-#     :param project_id: ID of the project
-#     :param annotation_list: List of Annotations
-#     :param session: Konfuzio session with Retry and Timeout policy
-#     :return: Response status.
-#     """
-#     url = get_document_annotations_url(document_id, project_id=project_id)
-#     r = session.post(url, json=annotation_list)
-#     r.raise_for_status()
-#     return r
+def _build_annotation_payload(
+    label_id: int,
+    label_set_id: int,
+    confidence: Union[float, None] = None,
+    revised: bool = False,
+    is_correct: bool = False,
+    annotation_set=None,
+    **kwargs,
+) -> dict:
+    """
+    Build the data the Konfuzio Server expects to create an Annotation.
+
+    :param label_id: ID of the Label
+    :param label_set_id: ID of the Label Set where the Annotation belongs
+    :param confidence: Confidence of the Annotation still called Accuracy by text-annotation
+    :param revised: If the Annotation is revised or not (bool)
+    :param is_correct: If the Annotation is corrected or not (bool)
+    :param annotation_set: Annotation Set to connect to the server
+    :return: Data of the Annotation.
+    """
+    data = {
+        'start_offset': kwargs.get('start_offset', None),
+        'end_offset': kwargs.get('end_offset', None),
+        'label': label_id,
+        'revised': revised,
+        'section_label_id': label_set_id,
+        'accuracy': confidence,
+        'is_correct': is_correct,
+        'section': annotation_set,
+    }
+
+    custom_bboxes = kwargs.get('bboxes', None)
+    if custom_bboxes is not None:
+        data['custom_bboxes'] = custom_bboxes
+
+    return data
+
+
+def _prepare_json_post(session, url: str):
+    """
+    Prepare a POST request once, so it can be sent repeatedly with different JSON data.
+
+    Headers, authentication and environment settings of the session are only resolved once, instead of per request.
+
+    :param session: Konfuzio session with Retry and Timeout policy
+    :param url: URL to post the data to
+    :return: Function which posts the given data and returns the Response.
+    """
+    prepared_request = session.prepare_request(
+        requests.Request('POST', url, headers={'Content-Type': 'application/json'})
+    )
+    send_kwargs = session.merge_environment_settings(url, {}, None, None, None)
+
+    def post(data) -> requests.Response:
+        request = prepared_request.copy()
+        # serialize like requests does for json=, e.g. numpy floats are supported and NaN is rejected
+        request.body = json.dumps(data, allow_nan=False).encode('utf-8')
+        request.headers['Content-Length'] = str(len(request.body))
+        return session.send(request, **send_kwargs)
+
+    return post
+
+
+def post_document_bulk_annotation(document_id: int, project_id: int, annotation_list, session=None):
+    """
+    Add a list of Annotations to an existing document.
+
+    :param document_id: ID of the file
+    :param project_id: ID of the project
+    :param annotation_list: List of Annotations
+    :param session: Konfuzio session with Retry and Timeout policy
+    :return: Response status.
+    """
+    session = session or _get_default_session()
+    url = get_document_annotations_url(document_id, project_id=project_id)
+    r = session.post(url, json=annotation_list)
+    r.raise_for_status()
+    return r
+
+
+def post_document_annotations_batched(
+    document_id: int, project_id: int, annotations: List[dict], batch_size: int = 200, session=None
+) -> List[requests.Response]:
+    """
+    Add many Annotations to an existing document using one request per batch of Annotations.
+
+    :param document_id: ID of the file
+    :param project_id: ID of the project
+    :param annotations: Keyword arguments of post_document_annotation for each Annotation, without document and project
+    :param batch_size: Maximum number of Annotations sent per request
+    :param session: Konfuzio session with Retry and Timeout policy
+    :return: Response status of each batch.
+    """
+    session = session or _get_default_session()
+    url = get_document_annotations_url(document_id, project_id=project_id)
+    annotation_list = [_build_annotation_payload(**annotation) for annotation in annotations]
+    post = _prepare_json_post(session, url)
+    responses = []
+    for i in range(0, len(annotation_list), batch_size):
+        r = post(annotation_list[i : i + batch_size])
+        r.raise_for_status()
+        responses.append(r)
+    return responses
 
 
 def post_document_annotation(
@@ -251,7 +510,7 @@ def post_document_annotation(
     revised: bool = False,
     is_correct: bool = False,
     annotation_set=None,
-    session=_konfuzio_session(),
+    session=None,
     **kwargs,
 ):
     """
@@ -276,55 +535,25 @@ def post_document_annotation(
     :param session: Konfuzio session with Retry and Timeout policy
     :return: Response status.
     """
+    session = session or _get_default_session()
     url = get_document_annotations_url(document_id, project_id=project_id)
-
-    # bbox = kwargs.get('bbox', None)
-    custom_bboxes = kwargs.get('bboxes', None)
-    # selection_bbox = kwargs.get('selection_bbox', None)
-    # page_number = kwargs.get('page_number', None)
-    # offset_string = kwargs.get('offset_string', None)
-    start_offset = kwargs.get('start_offset', None)
-    end_offset = kwargs.get('end_offset', None)
-
-    data = {
-        'start_offset': start_offset,
-        'end_offset': end_offset,
-        'label': label_id,
-        'revised': revised,
-        'section_label_id': label_set_id,
-        'accuracy': confidence,
-        'is_correct': is_correct,
-    }
-
-    if end_offset:
-        data['end_offset'] = end_offset
-
-    if start_offset is not None:
-        data['start_offset'] = start_offset
-
-    data['section'] = annotation_set
-
-    # if page_number is not None:
-    #     data['page_number'] = page_number
-    #
-    # if offset_string is not None:
-    #     data['offset_string'] = offset_string
-    #
-    # if bbox is not None:
-    #     data['bbox'] = bbox
-    #
-    # if selection_bbox is not None:
-    #     data['selection_bbox'] = selection_bbox
-
-    if custom_bboxes is not None:
-        data['custom_bboxes'] = custom_bboxes
+    data = _build_annotation_payload(
+        label_id=label_id,
+        label_set_id=label_set_id,
+        confidence=confidence,
+        revised=revised,
+        is_correct=is_correct,
+        annotation_set=annotation_set,
+        **kwargs,
+    )
 
     r = session.post(url, json=data)
-    assert r.status_code == 201
+    if r.status_code != 201:
+        raise HTTPError(f'{r.status_code} {r.reason}: {r.text} via {r.url}', response=r)
     return r
 
 
-def delete_document_annotation(document_id: int, annotation_id: int, project_id: int, session=_konfuzio_session()):
+def delete_document_annotation(document_id: int, annotation_id: int, project_id: int, session=None):
     """
     Delete a given Annotation of the given document.
 
@@ -334,18 +563,41 @@ def delete_document_annotation(document_id: int, annotation_id: int, project_id:
     :param session: Konfuzio session with Retry and Timeout policy
     :return: Response status.
     """
+    session = session or _get_default_session()
     url = get_annotation_url(document_id=document_id, annotation_id=annotation_id, project_id=project_id)
     r = session.delete(url)
-    if r.status_code == 200:
+    status_code = r.status_code
+    if status_code == 200:
         # the text Annotation received negative feedback and copied the Annotation and created a new one
-        return json.loads(r.text)['id']
-    elif r.status_code == 204:
+        return _loads(r)['id']
+    elif status_code == 204:
         return r
     else:
-        raise ConnectionError(f'Error{r.status_code}: {r.content} {r.url}')
+        raise ConnectionError(f'Error{status_code}: {r.content} {r.url}')
+
+
+def _get_page_urls(next_url: str, count: int) -> List[str]:
+    """
+    Build the URLs of all remaining pages of a list paginated by limit and offset.
+
+    :param next_url: URL of the next page as provided by the Konfuzio Server
+    :param count: Total number of items in the list
+    :return: URLs of all remaining pages, only the next page if the list is not paginated by limit and offset.
+    """
+    scheme, netloc, path, query, fragment = urlsplit(next_url)
+    params = parse_qs(query)
+    if 'limit' not in params or 'offset' not in params:
+        return [next_url]
+    # use the limit of the Server, which might be lower than the limit requested
+    limit = int(params['limit'][0])
+    page_urls = []
+    for offset in range(int(params['offset'][0]), count, limit):
+        params['offset'] = [str(offset)]
+        page_urls.append(urlunsplit((scheme, netloc, path, urlencode(params, doseq=True), fragment)))
+    return page_urls
 
 
-def get_meta_of_files(project_id: int, limit: int = 1000, session=_konfuzio_session()) -> List[dict]:
+def get_meta_of_files(project_id: int, limit: int = 1000, session=None) -> List[dict]:
     """
     Get meta information of Documents in a Project.
 
@@ -354,17 +606,26 @@ def get_meta_of_files(project_id: int, limit: int = 1000, session=_konfuzio_sess
     :param session: Konfuzio session with Retry and Timeout policy
     :return: Sorted Documents names in the format {id_: 'pdf_name'}.
     """
+    session = session or _get_default_session()
     url = get_documents_meta_url(project_id=project_id, limit=limit)
     result = []
     r = session.get(url)
-    data = r.json()
+    data = _loads(r)
     result += data['results']
 
-    while 'next' in data.keys() and data['next']:
+    if data.get('next'):
+        # once the first page is known, all further pages can be requested at the same time
+        page_urls = _get_page_urls(next_url=data['next'], count=data.get('count', 0))
+        logger.info(f'Iterate on {len(page_urls)} paginated {url}.')
+        with ThreadPoolExecutor(max_workers=_MAX_CONCURRENT_REQUESTS) as executor:
+            for data in executor.map(lambda page_url: _loads(session.get(page_url)), page_urls):
+                result += data['results']
+
+    while data.get('next'):
         logger.info(f'Iterate on paginated {url}.')
         url = data['next']
         r = session.get(url)
-        data = r.json()
+        data = _loads(r)
         result += data['results']
 
     sorted_documents = sorted(result, key=itemgetter('id'))
@@ -375,7 +636,7 @@ def create_label(
     project_id: int,
     label_name: str,
     label_sets: list,
-    session=_konfuzio_session(),
+    session=None,
     description=None,
     has_multiple_top_candidates=None,
     data_type=None,
@@ -392,6 +653,7 @@ def create_label(
     :param data_type: Expected data type of any Span of Annotations related to this Label.
     :return: Label ID in the Konfuzio Server.
     """
+    session = session or _get_default_session()
     url = get_labels_url()
     label_sets_ids = [label_set.id_ for label_set in label_sets]
 
@@ -405,17 +667,61 @@ def create_label(
     }
 
     r = session.post(url=url, json=data)
-
-    assert r.status_code == 201
-    label_id = r.json()['id']
+    if r.status_code != 201:
+        raise HTTPError(f'{r.status_code} {r.reason}: {r.text} via {r.url}', response=r)
+    label_id = _loads(r)['id']
     return label_id
 
 
+class _MultipartFileBody:
+    """
+    Multipart form data of a file upload, which reads the file in chunks while the request is sent.
+
+    The length of the body is known in advance, so the request is sent with a Content-Length instead of chunked.
+    """
+
+    def __init__(self, fields: dict, file_field: str, file_path: str, content_type: str, chunk_size: int = 1 << 16):
+        """Render all parts except the content of the file, which is only read when the body is sent."""
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.boundary = choose_boundary()
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+
+        head = b''
+        # like requests, skip fields without value
+        for name, value in fields.items():
+            if value is not None:
+                field = RequestField(name=name, data=str(value).encode('utf-8'))
+                field.make_multipart()
+                head += self._render_part(field)
+        file_part = RequestField(name=file_field, data=b'', filename=os.path.basename(file_path))
+        file_part.make_multipart(content_type=content_type)
+        self.head = head + f'--{self.boundary}\r\n'.encode('latin-1') + file_part.render_headers().encode('latin-1')
+        self.tail = f'\r\n--{self.boundary}--\r\n'.encode('latin-1')
+
+    def _render_part(self, field: RequestField) -> bytes:
+        """Render a form field including its boundary."""
+        headers = field.render_headers().encode('latin-1')
+        return f'--{self.boundary}\r\n'.encode('latin-1') + headers + field.data + b'\r\n'
+
+    def __len__(self) -> int:
+        """Return the size of the body in bytes."""
+        return len(self.head) + os.path.getsize(self.file_path) + len(self.tail)
+
+    def __iter__(self):
+        """Yield the body, the file in chunks. Every iteration reads the file again, so the body can be resent."""
+        yield self.head
+        with open(self.file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                yield chunk
+        yield self.tail
+
+
 def upload_file_konfuzio_api(
     filepath: str,
     project_id: int,
     dataset_status: int = 0,
-    session=_konfuzio_session(),
+    session=None,
     category_id: Union[None, int] = None,
 ):
     """
@@ -428,20 +734,19 @@ def upload_file_konfuzio_api(
     :param category_id: Define a Category the Document belongs to
     :return: Response status.
     """
+    session = session or _get_default_session()
     url = get_upload_document_url()
     is_file(filepath)
 
-    with open(filepath, "rb") as f:
-        file_data = f.read()
-
-    files = {"data_file": (os.path.basename(filepath), file_data, "multipart/form-data")}
     data = {"project": project_id, "dataset_status": dataset_status, "category_template": category_id}
 
-    r = session.post(url=url, files=files, data=data)
+    # stream the file while it is sent, instead of building the whole multipart body in memory
+    body = _MultipartFileBody(data, file_field="data_file", file_path=filepath, content_type="multipart/form-data")
+    r = session.post(url=url, data=body, headers={'Content-Type': body.content_type})
     return r
 
 
-def delete_file_konfuzio_api(document_id: int, session=_konfuzio_session()):
+def delete_file_konfuzio_api(document_id: int, session=None):
     """
     Delete Document by ID via Konfuzio API.
 
@@ -449,15 +754,17 @@ def delete_file_konfuzio_api(document_id: int, session=_konfuzio_session()):
     :param session: Konfuzio session with Retry and Timeout policy
     :return: File id_ in Konfuzio Server.
     """
+    session = session or _get_default_session()
     url = get_document_url(document_id)
     data = {'id': document_id}
 
     r = session.delete(url=url, json=data)
-    assert r.status_code == 204
+    if r.status_code != 204:
+        raise HTTPError(f'{r.status_code} {r.reason}: {r.text} via {r.url}', response=r)
     return True
 
 
-def update_document_konfuzio_api(document_id: int, session=_konfuzio_session(), **kwargs):
+def update_document_konfuzio_api(document_id: int, session=None, **kwargs):
     """
     Update an existing Document via Konfuzio API.
 
@@ -465,6 +772,7 @@ def update_document_konfuzio_api(document_id: int, session=_konfuzio_session(),
     :param session: Konfuzio session with Retry and Timeout policy
     :return: Response status.
     """
+    session = session or _get_default_session()
     url = get_document_url(document_id)
 
     data = {}
@@ -486,10 +794,10 @@ def update_document_konfuzio_api(document_id: int, session=_konfuzio_session(),
         data.update({"assignee": assignee})
 
     r = session.patch(url=url, json=data)
-    return json.loads(r.text)
+    return _loads(r)
 
 
-def download_file_konfuzio_api(document_id: int, ocr: bool = True, session=_konfuzio_session()):
+def download_file_konfuzio_api(document_id: int, ocr: bool = True, session=None, output_path: str = None):
     """
     Download file from the Konfuzio server using the Document id_.
 
@@ -498,38 +806,55 @@ def download_file_konfuzio_api(document_id: int, ocr: bool = True, session=_konf
     :param document_id: ID of the document
     :param ocr: Bool to get the ocr version of the document
     :param session: Konfuzio session with Retry and Timeout policy
-    :return: The downloaded file.
+    :param output_path: Write the file to this path while it is downloaded, instead of loading it into memory
+    :return: The downloaded file, or the path it was written to if an output_path is provided.
     """
+    session = session or _get_default_session()
     if ocr:
         url = get_document_ocr_file_url(document_id)
     else:
         url = get_document_original_file_url(document_id)
 
-    r = session.get(url)
+    r = session.get(url, stream=output_path is not None)
 
     content_type = r.headers.get('content-type')
     if content_type not in ['application/pdf', 'image/jpeg', 'image/png', 'image/jpg']:
         logger.info(f'CONTENT TYP of {document_id} is {content_type} and no PDF or image.')
 
-    logger.info(f'Downloaded file {document_id} from {KONFUZIO_HOST}.')
-    return r.content
+    if output_path is None:
+        logger.info(f'Downloaded file {document_id} from {KONFUZIO_HOST}.')
+        return r.content
+
+    with r, open(output_path, 'wb') as f:
+        try:
+            for chunk in r.iter_content(chunk_size=1 << 20):
+                f.write(chunk)
+        except Exception:
+            # do not leave an incomplete file, which would look like a finished download
+            f.close()
+            os.remove(output_path)
+            raise
+
+    logger.info(f'Downloaded file {document_id} from {KONFUZIO_HOST} to {output_path}.')
+    return output_path
 
 
-def get_results_from_segmentation(doc_id: int, project_id: int, session=_konfuzio_session()) -> List[List[dict]]:
+def get_results_from_segmentation(doc_id: int, project_id: int, session=None) -> List[List[dict]]:
     """Get bbox results from segmentation endpoint.
 
     :param doc_id: ID of the document
     :param project_id: ID of the Project.
     :param session: Konfuzio session with Retry and Timeout policy
     """
+    session = session or _get_default_session()
     segmentation_url = get_document_segmentation_details_url(doc_id, project_id)
     response = session.get(segmentation_url)
-    segmentation_result = response.json()
+    segmentation_result = _loads(response)
 
     return segmentation_result
 
 
-def upload_ai_model(ai_model_path: str, category_ids: List[int] = None, session=_konfuzio_session()):  # noqa: F821
+def upload_ai_model(ai_model_path: str, category_ids: List[int] = None, session=None):  # noqa: F821
     """
     Upload an ai_model to the text-annotation server.
 
@@ -538,6 +863,7 @@ def upload_ai_model(ai_model_path: str, category_ids: List[int] = None, session=
     :param session: session to connect to server
     :return:
     """
+    session = session or _get_default_session()
     url = get_create_ai_model_url()
     if is_file(ai_model_path):
         model_name = os.path.basename(ai_model_path)
@@ -546,7 +872,7 @@ def upload_ai_model(ai_model_path: str, category_ids: List[int] = None, session=
             headers = {"Prefer": "respond-async"}
             r = session.post(url, files=multipart_form_data, headers=headers)
             r.raise_for_status()
-    data = r.json()
+    data = _loads(r)
     ai_model_id = data['id']
     ai_model = data['ai_model']
 
@@ -554,7 +880,7 @@ def upload_ai_model(ai_model_path: str, category_ids: List[int] = None, session=
         url = get_update_ai_model_url(ai_model_id)
         data = {'templates': category_ids}
         headers = {'content-type': 'application/json'}
-        response = session.patch(url, data=json.dumps(data), headers=headers)
+        response = session.patch(url, data=_json.dumps(data), headers=headers)
         response.raise_for_status()
 
     logger.info(f'New AI Model uploaded {ai_model} to {url}')
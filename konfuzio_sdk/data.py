@@ -17,7 +17,6 @@ from PIL import Image
 from tqdm import tqdm
 
 from konfuzio_sdk.api import (
-    _konfuzio_session,
     download_file_konfuzio_api,
     get_meta_of_files,
     get_project_details,
@@ -41,7 +40,7 @@ class Data:
     id_iter = itertools.count()
     id_ = None
     id_local = None
-    session = _konfuzio_session()
+    session = None  # API functions fall back to the default session of konfuzio_sdk.api
     _update = False
     _force_offline = False
 
@@ -1789,9 +1788,7 @@ class Document(Data):
             file_path = self.file_path
 
         if self.status[0] == 2 and (not file_path or not is_file(file_path, raise_exception=False) or update):
-            pdf_content = download_file_konfuzio_api(self.id_, ocr=ocr_version, session=self.session)
-            with open(file_path, "wb") as f:
-                f.write(pdf_content)
+            download_file_konfuzio_api(self.id_, ocr=ocr_version, session=self.session, output_path=file_path)
 
         return file_path
 
@@ -3,12 +3,20 @@ import datetime
 import logging
 import os
 import json
+import pickle
 import sys
+import threading
 import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from unittest.mock import patch
+from urllib.parse import parse_qs, urlsplit
 
+import numpy
 import pytest
+import requests
 from requests import HTTPError
+from urllib3.filepost import encode_multipart_formdata
+from urllib3.util.retry import RequestHistory
 
 from konfuzio_sdk import BASE_DIR
 from konfuzio_sdk.api import (
@@ -22,6 +30,8 @@ from konfuzio_sdk.api import (
     update_document_konfuzio_api,
     get_project_list,
     get_document_details,
+    get_many_document_details,
+    submit_document_details,
     get_project_details,
     upload_ai_model,
     init_env,
@@ -29,13 +39,78 @@ from konfuzio_sdk.api import (
     create_new_project,
     create_label,
     TimeoutHTTPAdapter,
+    PostRetry,
+    _POST_RETRY_STRATEGY,
+    _get_default_session,
+    _loads,
+    _konfuzio_session,
+    _MultipartFileBody,
+    _get_page_urls,
     get_page_image,
+    post_document_annotations_batched,
+)
+from konfuzio_sdk.urls import (
+    get_document_annotations_url,
+    get_labels_url,
+    get_project_url,
+    get_projects_list_url,
+    get_upload_document_url,
 )
 from tests.variables import TEST_PROJECT_ID, TEST_DOCUMENT_ID
 
 FOLDER_ROOT = os.path.dirname(os.path.realpath(__file__))
 
 
+class _PaginatedSession:
+    """Mock session which serves the Documents of a Project in pages, like the Konfuzio Server."""
+
+    def __init__(self, count, limit, reported_count=None, provide_count=True, paginate_by_page=False):
+        """Define the Documents and how they are paginated."""
+        self.count = count
+        self.limit = limit
+        self.reported_count = count if reported_count is None else reported_count
+        self.provide_count = provide_count
+        self.paginate_by_page = paginate_by_page
+        self.requested = []
+
+    def get(self, url):
+        """Return the page of Documents the URL refers to."""
+        self.requested.append(url)
+        params = parse_qs(urlsplit(url).query)
+        if self.paginate_by_page:
+            offset = (int(params.get('page', ['1'])[0]) - 1) * self.limit
+            next_url = f'https://app.konfuzio.com/api/projects/1/docs/?page={offset // self.limit + 2}'
+        else:
+            offset = int(params.get('offset', ['0'])[0])
+            next_url = f'https://app.konfuzio.com/api/projects/1/docs/?limit={self.limit}&offset={offset + self.limit}'
+        data = {
+            'next': next_url if offset + self.limit < self.count else None,
+            'results': [{'id': i} for i in range(offset, min(offset + self.limit, self.count))],
+        }
+        if self.provide_count:
+            data['count'] = self.reported_count
+        response = requests.Response()
+        response._content = json.dumps(data).encode('utf-8')
+        return response
+
+
+class _BulkAnnotationSession(requests.Session):
+    """Mock requests Session which does not send requests."""
+
+    def __init__(self):
+        """Collect the data of each request."""
+        super().__init__()
+        self.posted = []
+
+    def send(self, request, **kwargs):
+        """Store the posted data."""
+        assert request.headers['Content-Length'] == str(len(request.body))
+        self.posted.append(json.loads(request.body))
+        response = requests.Response()
+        response.status_code = 201
+        return response
+
+
 class TestKonfuzioSDKAPI(unittest.TestCase):
     """Test API with payslip example Project."""
 
@@ -70,6 +145,47 @@ class TestKonfuzioSDKAPI(unittest.TestCase):
         """Get the meta information of Document in a Project."""
         get_meta_of_files(project_id=TEST_PROJECT_ID, limit=10)
 
+    def test_get_page_urls(self):
+        """Build the URLs of all remaining pages from the URL of the second page."""
+        page_urls = _get_page_urls('https://app.konfuzio.com/api/projects/1/docs/?limit=10&offset=10', count=35)
+        assert page_urls == [
+            'https://app.konfuzio.com/api/projects/1/docs/?limit=10&offset=10',
+            'https://app.konfuzio.com/api/projects/1/docs/?limit=10&offset=20',
+            'https://app.konfuzio.com/api/projects/1/docs/?limit=10&offset=30',
+        ]
+
+    def test_get_page_urls_without_offset(self):
+        """Only return the next page if the list is not paginated by limit and offset."""
+        page_urls = _get_page_urls('https://app.konfuzio.com/api/projects/1/docs/?page=2', count=35)
+        assert page_urls == ['https://app.konfuzio.com/api/projects/1/docs/?page=2']
+
+    def test_get_meta_of_files_concurrent_pages(self):
+        """Load all pages of a list paginated by limit and offset, each Document once."""
+        session = _PaginatedSession(count=25, limit=10)
+        result = get_meta_of_files(project_id=1, limit=10, session=session)
+        assert [document['id'] for document in result] == list(range(25))
+        assert len(session.requested) == 3
+
+    def test_get_meta_of_files_without_count(self):
+        """Follow the next links one by one if the Server does not provide the number of Documents."""
+        session = _PaginatedSession(count=25, limit=10, provide_count=False)
+        result = get_meta_of_files(project_id=1, limit=10, session=session)
+        assert [document['id'] for document in result] == list(range(25))
+        assert len(session.requested) == 3
+
+    def test_get_meta_of_files_stale_count(self):
+        """Follow the next links of the last page if more Documents exist than counted on the first page."""
+        session = _PaginatedSession(count=25, limit=10, reported_count=15)
+        result = get_meta_of_files(project_id=1, limit=10, session=session)
+        assert [document['id'] for document in result] == list(range(25))
+
+    def test_get_meta_of_files_without_offset(self):
+        """Follow the next links one by one if the list is not paginated by limit and offset."""
+        session = _PaginatedSession(count=25, limit=10, paginate_by_page=True)
+        result = get_meta_of_files(project_id=1, limit=10, session=session)
+        assert [document['id'] for document in result] == list(range(25))
+        assert len(session.requested) == 3
+
     @patch("requests.post")
     def test_empty_project(self, function):
         """Get the meta information of Documents if the Project is empty."""
@@ -172,6 +288,17 @@ class TestKonfuzioSDKAPI(unittest.TestCase):
             'category_template',
         }
 
+    def test_many_document_details(self):
+        """Test to get the details of many Documents in the order of their IDs."""
+        document_ids = [TEST_DOCUMENT_ID, 214414]
+        documents = get_many_document_details(document_ids=document_ids, project_id=TEST_PROJECT_ID)
+        assert [document['id'] for document in documents] == document_ids
+
+    def test_submit_document_details(self):
+        """Test to parse the details of a Document in the background."""
+        future = submit_document_details(document_id=TEST_DOCUMENT_ID, project_id=TEST_PROJECT_ID)
+        assert future.result() == get_document_details(document_id=TEST_DOCUMENT_ID, project_id=TEST_PROJECT_ID)
+
     def test_get_list_of_files(self):
         """Get meta information from Documents in the Project."""
         sorted_documents = get_meta_of_files(project_id=TEST_PROJECT_ID)
@@ -186,6 +313,26 @@ class TestKonfuzioSDKAPI(unittest.TestCase):
         document_id = json.loads(doc.text)['id']
         assert delete_file_konfuzio_api(document_id)
 
+    def test_multipart_file_body(self):
+        """Test that the streamed upload body equals the multipart body built by requests."""
+        file_path = os.path.join(FOLDER_ROOT, 'test_data', 'pdf.pdf')
+        data = {"project": 1, "dataset_status": 0, "category_template": None}
+        body = _MultipartFileBody(data, file_field="data_file", file_path=file_path, content_type="multipart/form-data")
+        with open(file_path, 'rb') as f:
+            file_data = f.read()
+        fields = {
+            "project": b"1",
+            "dataset_status": b"0",
+            "data_file": ("pdf.pdf", file_data, "multipart/form-data"),
+        }
+        expected_body, content_type = encode_multipart_formdata(fields, boundary=body.boundary)
+        streamed_body = b''.join(body)
+        assert streamed_body == expected_body
+        assert len(body) == len(expected_body)
+        assert body.content_type == content_type
+        # the body can be iterated again, e.g. to retry the request
+        assert b''.join(body) == expected_body
+
     def test_download_file_with_ocr(self):
         """Test to download the OCR version of a document."""
         document_id = 215906
@@ -198,6 +345,17 @@ class TestKonfuzioSDKAPI(unittest.TestCase):
         downloaded_file = download_file_konfuzio_api(document_id=document_id, ocr=False)
         logging.info(f'Size of file {document_id}: {sys.getsizeof(downloaded_file)}')
 
+    def test_download_file_to_output_path(self):
+        """Test to write the downloaded file to disk while it is downloaded."""
+        document_id = 215906
+        output_path = os.path.join(FOLDER_ROOT, 'test_data', f'{document_id}_download.pdf')
+        try:
+            assert download_file_konfuzio_api(document_id=document_id, output_path=output_path) == output_path
+            with open(output_path, 'rb') as f:
+                assert f.read() == download_file_konfuzio_api(document_id=document_id)
+        finally:
+            os.remove(output_path)
+
     def test_download_file_not_available(self):
         """Test to download the original version of a document."""
         document_id = 15631000000000000000000000000
@@ -357,10 +515,7 @@ class TestKonfuzioSDKAPI(unittest.TestCase):
             """Mock requests POST response."""
 
             status_code = 201
-
-            def json(self):
-                """Mock valid return."""
-                return {"id": 420}
+            content = b'{"id": 420}'
 
             def post(self, *arg, **kwargs):
                 """Empty return value."""
@@ -368,6 +523,51 @@ class TestKonfuzioSDKAPI(unittest.TestCase):
 
         create_label(project_id=0, label_name='', label_sets=[], session=_Session())
 
+    def test_post_document_annotations_batched(self):
+        """Post Annotations in batches using one request per batch."""
+        session = _BulkAnnotationSession()
+        annotations = [{'label_id': 1, 'label_set_id': 2, 'start_offset': i, 'end_offset': i + 1} for i in range(5)]
+        responses = post_document_annotations_batched(
+            document_id=0, project_id=0, annotations=annotations, batch_size=2, session=session
+        )
+        assert len(responses) == 3
+        assert [len(batch) for batch in session.posted] == [2, 2, 1]
+        assert session.posted[2][0]['start_offset'] == 4
+        assert session.posted[2][0]['label'] == 1
+
+    def test_post_document_annotations_batched_numpy_confidence(self):
+        """Serialize Annotations like requests does for other POST requests, e.g. with confidences from numpy."""
+        session = _BulkAnnotationSession()
+        annotations = [{'label_id': 1, 'label_set_id': 2, 'confidence': numpy.float64(0.5)}]
+        post_document_annotations_batched(document_id=0, project_id=0, annotations=annotations, session=session)
+        assert session.posted[0][0]['accuracy'] == 0.5
+
+    def test_post_document_annotations_batched_nan_confidence(self):
+        """Reject a NaN confidence instead of sending it as null."""
+        session = _BulkAnnotationSession()
+        annotations = [{'label_id': 1, 'label_set_id': 2, 'confidence': float('nan')}]
+        with pytest.raises(ValueError):
+            post_document_annotations_batched(document_id=0, project_id=0, annotations=annotations, session=session)
+        assert session.posted == []
+
+    def test_create_label_error(self):
+        """Raise an HTTPError if the Label was not created, also if assertions are disabled."""
+        # mock session
+        class _Session:
+            """Mock requests POST response."""
+
+            status_code = 400
+            reason = 'Bad Request'
+            text = '{"text": ["This field may not be blank."]}'
+            url = 'https://app.konfuzio.com/api/v2/labels/'
+
+            def post(self, *arg, **kwargs):
+                """Empty return value."""
+                return self
+
+        with pytest.raises(HTTPError, match='400 Bad Request'):
+            create_label(project_id=0, label_name='', label_sets=[], session=_Session())
+
     def test_create_new_project(self):
         """Test to create new Project."""
         # mock session
@@ -375,10 +575,7 @@ class TestKonfuzioSDKAPI(unittest.TestCase):
             """Mock requests POST response."""
 
             status_code = 201
-
-            def json(self):
-                """Mock valid return."""
-                return {"id": 420}
+            content = b'{"id": 420}'
 
             def post(self, *arg, **kwargs):
                 """Empty return value."""
@@ -424,10 +621,7 @@ class TestKonfuzioSDKAPI(unittest.TestCase):
             """Mock requests POST response."""
 
             status_code = 200
-
-            def json(self):
-                """Mock valid return."""
-                return {"token": "faketoken"}
+            content = b'{"token": "faketoken"}'
 
         function.return_value = _Response()
         _get_auth_token('test', 'test')
@@ -446,6 +640,94 @@ class TestKonfuzioSDKAPI(unittest.TestCase):
             adapter.send(request=_Request())  # NOQA
             assert 'is missing' in context.exception
 
+    def test_default_session_is_reused(self):
+        """Test that API functions called without a session share one session."""
+        assert _get_default_session() is _get_default_session()
+
+    def test_session_uses_timeout_adapter_for_http_and_https(self):
+        """Test that requests via HTTP and HTTPS share the same Retry and Timeout policy."""
+        session = _konfuzio_session()
+        assert isinstance(session.get_adapter('https://app.konfuzio.com'), TimeoutHTTPAdapter)
+        assert session.get_adapter('http://localhost:8000') is session.get_adapter('https://app.konfuzio.com')
+
+    def test_post_retry(self):
+        """Test that POST requests are only retried on gateway errors."""
+        assert _POST_RETRY_STRATEGY.is_retry('POST', 503)
+        assert not _POST_RETRY_STRATEGY.is_retry('POST', 504)
+        assert not _POST_RETRY_STRATEGY.is_retry('POST', 500)
+        assert not _POST_RETRY_STRATEGY.is_retry('POST', 429)
+        assert _POST_RETRY_STRATEGY.is_retry('GET', 500)
+
+    def test_post_retry_limit(self):
+        """Test that POST requests are retried at most twice, independent of the total of the Retry strategy."""
+        history = (RequestHistory('POST', '/api/projects/', None, 503, None),)
+        assert _POST_RETRY_STRATEGY.new(history=history).is_retry('POST', 503)
+        assert not _POST_RETRY_STRATEGY.new(history=history * 2).is_retry('POST', 503)
+        assert _POST_RETRY_STRATEGY.new(history=history * 2).is_retry('GET', 503)
+
+    def test_create_new_project_after_post_retries(self):
+        """Test that the last response reaches create_new_project once the POST retries are used up."""
+        requested = []
+
+        class _Handler(BaseHTTPRequestHandler):
+            """Mock a gateway which is unavailable."""
+
+            def do_POST(self):
+                """Respond with 503 to every request."""
+                requested.append(self.path)
+                self.rfile.read(int(self.headers['Content-Length']))
+                self.send_response(503)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'{}')
+
+            def log_message(self, *args):
+                """Do not log requests."""
+
+        server = HTTPServer(('127.0.0.1', 0), _Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_port}/api/projects/'
+        session = _konfuzio_session(token='faketoken')
+        retry = _POST_RETRY_STRATEGY.new(backoff_factor=0)
+        session.mount_exact(url, adapter=TimeoutHTTPAdapter(max_retries=retry, timeout=5))
+        try:
+            with patch('konfuzio_sdk.api.get_projects_list_url', return_value=url):
+                with pytest.raises(PermissionError, match='HTTP Status 503'):
+                    create_new_project('test', session=session)
+        finally:
+            server.shutdown()
+        assert len(requested) == 1 + PostRetry.POST_TOTAL
+
+    def test_session_retries_post_only_to_create_projects_and_labels(self):
+        """Test that only creating Projects and Labels uses the Retry strategy for POST requests."""
+        session = _konfuzio_session()
+        assert isinstance(session.get_adapter(get_labels_url()).max_retries, PostRetry)
+        assert isinstance(session.get_adapter(get_projects_list_url()).max_retries, PostRetry)
+        assert not isinstance(session.get_adapter(get_upload_document_url()).max_retries, PostRetry)
+        annotations_url = get_document_annotations_url(document_id=1, project_id=2)
+        assert not isinstance(session.get_adapter(annotations_url).max_retries, PostRetry)
+        assert not isinstance(session.get_adapter(get_project_url(project_id=2)).max_retries, PostRetry)
+
+    def test_session_can_be_pickled(self):
+        """Test that the adapters for exact URLs are kept when a session is pickled."""
+        session = pickle.loads(pickle.dumps(_konfuzio_session()))
+        assert isinstance(session.get_adapter(get_labels_url()).max_retries, PostRetry)
+
+    def test_loads(self):
+        """Test that JSON is parsed from the raw bytes of a response."""
+        response = requests.Response()
+        response._content = '{"id": 420, "name": "ü"}'.encode('utf-8')
+        assert _loads(response) == {'id': 420, 'name': 'ü'}
+
+    def test_loads_invalid_json(self):
+        """Test that a response without JSON raises the JSONDecodeError of requests, like Response.json()."""
+        response = requests.Response()
+        response._content = b'<html><body>502 Bad Gateway</body></html>'
+        with pytest.raises(requests.exceptions.JSONDecodeError):
+            _loads(response)
+        with pytest.raises(requests.RequestException):
+            _loads(response)
+
     @patch("requests.post")
     def test_get_auth_token_connection_error(self, function):
         """Test to run CLI."""
@@ -476,10 +758,7 @@ class TestKonfuzioSDKAPI(unittest.TestCase):
             """Mock requests POST response."""
 
             status_code = 200
-
-            def json(self):
-                """Mock valid return."""
-                return {"token": "faketoken"}
+            content = b'{"token": "faketoken"}'
 
         function.return_value = _Response()
         env_file = ".testenv"